@@ -46,10 +46,14 @@ class database:
             data json,
             time NUMERIC,
             guid TEXT UNIQUE AS (data->>'$.id') STORED,
-            source TEXT AS (data->>'$.source') STORED
+            source TEXT AS (data->>'$.source') STORED,
+            seq INTEGER
 
         );
     """
+    INIT_SEQ = """
+        CREATE INDEX IF NOT EXISTS entries_seq ON entries(seq);
+    """
     INIT_SEARCH = f"""
         CREATE VIRTUAL TABLE IF NOT EXISTS search USING
         fts5(title,description,source,tokenize='{search_tokenizer}');
@@ -62,7 +66,10 @@ class database:
         );
     """
     REPLACE = """
-        REPLACE INTO entries(data,time) values (?,?);
+        REPLACE INTO entries(data,time,seq) values (?1,?2,coalesce(
+            (SELECT seq FROM entries WHERE guid = ?3 AND data = ?1),
+            (SELECT coalesce(max(seq),0)+1 FROM entries)
+        ));
     """
     REPLACE_SEARCH = """
         REPLACE INTO search(rowid,title,description,source) values (?,?,?,?); 
@@ -86,6 +93,12 @@ class database:
     GET_ENCLOSURE_URLS = """ 
         select json_each.value->>'href' from entries, json_each(entries.data->'links') where json_each.value->>'rel' = 'enclosure' and json_each.value->>'type' like 'image/%';
     """
+    GET_CHANGES = """
+        SELECT data,time,seq FROM entries WHERE seq > ? ORDER BY seq LIMIT ? ;
+    """
+    GET_MAX_SEQ = """
+        SELECT coalesce(max(seq),0) FROM entries;
+    """
     GET_ETAG="""
         SELECT etag,time from etags where feed = ?;
     """
@@ -99,6 +112,12 @@ class database:
         self.cursor.execute(database.INIT)
         self.cursor.execute(database.INIT_SEARCH)
         self.cursor.execute(database.INIT_ETAG)
+        self.cursor.execute("PRAGMA table_info(entries);")
+        if "seq" not in [col[1] for col in self.cursor.fetchall()]:
+            self.cursor.execute("ALTER TABLE entries ADD COLUMN seq INTEGER;")
+            self.cursor.execute("UPDATE entries SET seq = rowid;")
+            self.conn.commit()
+        self.cursor.execute(database.INIT_SEQ)
 
     def __del__(self):
         self.conn.commit()
@@ -106,7 +125,7 @@ class database:
 
     def update_entry(self, entry):
         pub_time = get_time(entry)
-        self.cursor.execute(database.REPLACE, [json.dumps(entry), pub_time])
+        self.cursor.execute(database.REPLACE, [json.dumps(entry), pub_time, entry.get("id")])
         self.cursor.execute(database.REPLACE_SEARCH,[self.cursor.lastrowid,entry.get('title',''),
                                                      entry.get('description',''),entry.get('source','')])
 
@@ -137,6 +156,17 @@ class database:
                 obj["links"] = map(FeedParserDict, obj["links"])
             entries.append(obj)
         return entries,(0,0)
+    def get_changes(self, since=0, limit=50):
+        self.cursor.execute(database.GET_CHANGES, [since, limit])
+        entries = []
+        for row in self.cursor.fetchall():
+            obj = FeedParserDict(json.loads(row[0]))
+            entries.append(obj)
+            since = row[2]
+        return entries, since
+    def get_max_seq(self):
+        self.cursor.execute(database.GET_MAX_SEQ)
+        return self.cursor.fetchone()[0]
     def set_etag(self, feed_url,etag):
         ts = int(datetime.datetime.now().timestamp())
         self.cursor.execute(self.REPLACE_ETAG,[feed_url,etag,ts])
@@ -259,6 +289,16 @@ def html_sanitize(html):
     return nh3.clean(html,tags=set(allowed_tags))
 
 
+feed_updated = asyncio.Event()
+
+
+def notify_feed_updated():
+    # Wake up long-polling /changes requests and arm a fresh event.
+    global feed_updated
+    feed_updated.set()
+    feed_updated = asyncio.Event()
+
+
 async def update_feed(session, url):
     feed = None
     try:
@@ -291,6 +331,65 @@ async def update_feed(session, url):
         db.update_entry(entry)
     print("Processing done")
     db.conn.commit()
+    notify_feed_updated()
+
+
+HTTP_LIMIT = 100
+HTTP_COUNTERS = (
+    "requests",
+    "connections_created",
+    "connections_reused",
+    "dns_cache_hits",
+    "dns_cache_misses",
+)
+
+http_session = None
+http_stats = {
+    "total": dict.fromkeys(HTTP_COUNTERS, 0),
+    "last_update": None,
+}
+
+
+def http_trace_config():
+    def count(key):
+        async def on_event(session, ctx, params):
+            http_stats["total"][key] += 1
+        return on_event
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(count("requests"))
+    trace.on_connection_create_end.append(count("connections_created"))
+    trace.on_connection_reuseconn.append(count("connections_reused"))
+    trace.on_dns_cache_hit.append(count("dns_cache_hits"))
+    trace.on_dns_cache_miss.append(count("dns_cache_misses"))
+    return trace
+
+
+def open_http_session():
+    # Idle connections and resolved hosts have to outlive the sleep between
+    # updates, otherwise nothing is reused across refresh cycles.
+    idle = args.update_period + 60
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=args.per_host_limit,
+        ttl_dns_cache=args.dns_ttl if args.dns_ttl is not None else idle,
+        keepalive_timeout=args.keepalive if args.keepalive is not None else idle,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=60),
+        trace_configs=[http_trace_config()],
+    )
+
+
+async def update_all(session):
+    before = dict(http_stats["total"])
+    start = time.monotonic()
+    await asyncio.gather(*[update_feed(session, url) for url in feeds])
+    last_update = {k: http_stats["total"][k] - before[k] for k in HTTP_COUNTERS}
+    last_update["seconds"] = round(time.monotonic() - start, 3)
+    http_stats["last_update"] = last_update
+    print("HTTP stats", last_update)
 
 
 async def gen_feed():
@@ -299,9 +398,11 @@ async def gen_feed():
     last_updated_at = now.isoformat()
     print("Database update at", last_updated_at)
 
-    timeout = aiohttp.ClientTimeout(total=60)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        await asyncio.gather(*[update_feed(session, url) for url in feeds])
+    if http_session is not None and not http_session.closed:
+        await update_all(http_session)
+    else:
+        async with open_http_session() as session:
+            await update_all(session)
 
 
 async def feed_generator():
@@ -369,6 +470,81 @@ async def atom_feed(request):
     return web.Response(content_type="text/xml", body=b)
 
 
+MAX_WAIT = 300
+
+
+def json_feed_time(parsed):
+    if not parsed:
+        return None
+    return datetime.datetime.fromtimestamp(
+        calendar.timegm(parsed), tz=datetime.timezone.utc
+    ).isoformat()
+
+
+def json_feed_item(entry):
+    # FeedParserDict.get("updated_parsed") falls back to published_parsed,
+    # so read the stored keys directly.
+    item = {
+        "id": entry.get("id") or entry.get("link"),
+        "url": entry.get("link"),
+        "title": entry.get("title"),
+        "content_html": entry.get("description") or "",
+        "date_published": json_feed_time(dict.get(entry, "published_parsed")),
+        "date_modified": json_feed_time(dict.get(entry, "updated_parsed")),
+        "_source": {"url": entry.get("source"), "title": entry.get("source_title")},
+    }
+    attachments = [
+        {"url": link["href"], "mime_type": link.get("type") or "application/octet-stream"}
+        for link in entry.get("links", [])
+        if link.get("rel") == "enclosure" and link.get("href")
+    ]
+    if attachments:
+        item["attachments"] = attachments
+    return {k: v for k, v in item.items() if v is not None}
+
+
+@routes.get("/changes")
+async def get_changes(request):
+    try:
+        since = int(request.rel_url.query.get("since", 0))
+        limit = int(request.rel_url.query.get("limit", LIMIT))
+        wait = int(request.rel_url.query.get("wait", 0))
+    except ValueError:
+        raise web.HTTPBadRequest(text="since, limit and wait must be integers")
+    limit = max(1, min(limit, LIMIT))
+    wait = max(0, min(wait, MAX_WAIT))
+    # A cursor past the newest entry means feeds.db was recreated.
+    reset = since > db.get_max_seq()
+    if reset:
+        since = 0
+    entries, cursor = db.get_changes(since, limit)
+    deadline = time.monotonic() + wait
+    while not entries and (remaining := deadline - time.monotonic()) > 0:
+        try:
+            await asyncio.wait_for(feed_updated.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            break
+        entries, cursor = db.get_changes(since, limit)
+    feed = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": "Reader Feed",
+        "feed_url": str(request.url.with_query(since=since)),
+        "_cursor": cursor,
+        "items": [json_feed_item(e) for e in entries],
+    }
+    # A full page means there may be more entries right after the cursor.
+    if len(entries) == limit:
+        feed["next_url"] = str(request.url.update_query(since=cursor))
+    if reset:
+        feed["_reset"] = True
+    return web.json_response(feed, content_type="application/feed+json")
+
+
+@routes.get("/stats.json")
+async def get_http_stats(request):
+    return web.json_response(http_stats)
+
+
 @routes.get("/feed.css")
 async def stylesheet(request):
     return web.FileResponse("feed.css")
@@ -417,6 +593,12 @@ arg_parser.add_argument(
 )
 arg_parser.add_argument('-t',dest="update_period", type= int, help="Seconds between database updates",default=3600)
 arg_parser.add_argument('--no-etag', action='store_true', help="Disables ETag and Last-Modified checks")
+arg_parser.add_argument('--per-host-limit', type=int, default=0,
+                        help="Max simultaneous connections per host (0 - no limit)")
+arg_parser.add_argument('--dns-ttl', type=int,
+                        help="Seconds to cache DNS lookups (default: update period + 60)")
+arg_parser.add_argument('--keepalive', type=int,
+                        help="Seconds to keep idle connections open (default: update period + 60)")
 def host_tuple(x):
     l=x.split(':')
     if not len(l):
@@ -460,17 +642,22 @@ if args.file:
 
 
 async def serve():
-    global feed_gen_task
+    global feed_gen_task, http_session
+    http_session = open_http_session()
     if args.update:
         feed_gen_task = asyncio.create_task(feed_generator())
     app = web.Application()
     app.add_routes(routes)
     runner = web.AppRunner(app)
-    await runner.setup()
-    host,port = args.host_port
-    site = web.TCPSite(runner,host=host,port=port)
-    await site.start()
-    await asyncio.Event().wait()
+    try:
+        await runner.setup()
+        host,port = args.host_port
+        site = web.TCPSite(runner,host=host,port=port)
+        await site.start()
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await http_session.close()
 
 
 if args.serve: